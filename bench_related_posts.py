@@ -0,0 +1,41 @@
+"""Benchmark the related-posts TF-IDF build on a synthetic corpus.
+
+Usage: python bench_related_posts.py [n_posts]
+"""
+import sys
+import time
+import tracemalloc
+import numpy as np
+from scrapper.related_posts import build_tfidf, top_k_neighbours
+
+
+def synthetic_docs(n, vocab_size=20000, words_per_doc=60, seed=0):
+    rng = np.random.default_rng(seed)
+    vocab = np.array([f'w{i}' for i in range(vocab_size)])
+    # Zipf-like word frequencies, as in real titles and descriptions
+    weights = 1 / np.arange(1, vocab_size + 1)
+    words = rng.choice(vocab, size=(n, words_per_doc), p=weights / weights.sum())
+    return [' '.join(row) for row in words]
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    docs = synthetic_docs(n)
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    matrix = build_tfidf(docs)
+    vectorized = time.perf_counter()
+    neighbours = sum(len(cols) for _, cols, _ in top_k_neighbours(matrix, matrix))
+    done = time.perf_counter()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f'Posts: {n}, vocabulary: {matrix.shape[1]}, non-zeros: {matrix.nnz}')
+    print(f'TF-IDF build: {vectorized - start:.2f}s')
+    print(f'Top-k search: {done - vectorized:.2f}s ({neighbours} neighbours)')
+    print(f'Peak traced memory: {peak / 2**20:.1f} MiB')
+
+
+if __name__ == '__main__':
+    main()
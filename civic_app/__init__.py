@@ -13,3 +13,6 @@ login_manager.login_view = 'login'
 login_manager.login_message_category = 'info'
 
 from civic_app import routes
+
+with app.app_context():
+    db.create_all()
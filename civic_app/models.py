@@ -81,4 +81,14 @@ class Notification(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     user = db.relationship('User', back_populates='notifications')
-    post = db.relationship('Post', back_populates='notifications')
\ No newline at end of file
+    post = db.relationship('Post', back_populates='notifications')
+
+class RelatedPost(db.Model):
+    __tablename__ = 'related_post'
+
+    post_id = db.Column(db.Integer, db.ForeignKey('post.id'), primary_key=True)
+    rank = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    related_post_id = db.Column(db.Integer, db.ForeignKey('post.id'), nullable=False)
+    score = db.Column(db.Float, nullable=False)
+
+    related_post = db.relationship('Post', foreign_keys=[related_post_id])
@@ -5,7 +5,7 @@ from PIL import Image
 from flask import render_template, url_for, flash, redirect, request
 from civic_app import app, db, bcrypt
 from civic_app.forms import RegistrationForm, LoginForm, UpdateAccountForm, PostForm
-from civic_app.models import User, Post, Review, Interest, Notification
+from civic_app.models import User, Post, Review, Interest, Notification, RelatedPost
 from flask_login import login_user, current_user, logout_user, login_required
 from sqlalchemy import func, desc
 from datetime import datetime
@@ -87,7 +87,14 @@ def category_posts(category_id):
 def post_detail(post_id):
     post = Post.query.get_or_404(post_id)
     reviews = Review.query.filter_by(post_id=post_id).order_by(Review.date_posted.desc()).all()
-    return render_template('post.html', post=post, reviews=reviews)
+    # Neighbours are precomputed by scrapper.related_posts after each import
+    related_posts = db.session.query(Post).join(
+        RelatedPost, RelatedPost.related_post_id == Post.id
+    ).filter(
+        RelatedPost.post_id == post_id,
+        RelatedPost.rank >= 0
+    ).order_by(RelatedPost.rank).all()
+    return render_template('post.html', post=post, reviews=reviews, related_posts=related_posts)
 
 
 # ---------------------------------------------------------
@@ -1,10 +1,11 @@
-from scrapper import run_import_cycle , run_scrapper
+from scrapper import run_import_cycle , run_scrapper, run_retention
 import time
 
 hours_to_sleep = 1
 while(True):
     run_scrapper()
     run_import_cycle()
+    run_retention()
     print("*"*50)
     print("Sleeping 1 hour till next refresh")
     print("*"*50)
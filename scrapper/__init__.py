@@ -1,2 +1,3 @@
 from scrapper.data_loader import run_import_cycle
 from scrapper.data_scrapper import run_scrapper
+from scrapper.retention import run_retention
@@ -7,6 +7,7 @@ import glob
 from datetime import datetime
 from civic_app import app, db
 from civic_app.models import Post
+from scrapper.related_posts import run_related_index
 import time
 
 
@@ -22,6 +23,21 @@ def parse_pubdate(s):
     return None
 
 
+def truncate_title(title):
+    # Truncate title to match database constraint
+    return title[:100] if title else 'Untitled'
+
+
+def feed_titles():
+    """Titles of every item in the current RSS JSON files, as stored in Post."""
+    titles = set()
+    for path in glob.glob('rss_data/*.json'):
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        titles.update(truncate_title(it.get('title') or '') for it in data.get('items', []))
+    return titles
+
+
 def import_file(path):
     with open(path, 'r', encoding='utf-8') as f:
         data = json.load(f)
@@ -37,8 +53,7 @@ def import_file(path):
         pub = parse_pubdate(it.get('pubDate'))
         cat_name = it.get('category') or ''
 
-        # Truncate title to match database constraint
-        truncated_title = title[:100] if title else 'Untitled'
+        truncated_title = truncate_title(title)
         
         # Check if post with this title already exists
         existing_post = Post.query.filter_by(title=truncated_title).first()
@@ -78,5 +93,6 @@ def run_import_cycle():
                 print('  -> Error importing', p, e)
 
     print(f'Done. Total rows inserted: {imported_total}, Total duplicates skipped: {skipped_total}')
+    run_related_index()
 
 
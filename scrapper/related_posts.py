@@ -0,0 +1,226 @@
+"""Precompute the "related services" shown on the post detail page.
+
+Post titles and descriptions are vectorized with TF-IDF (NumPy/SciPy sparse
+matrices) and the top-k cosine neighbours of every post are stored in the
+RelatedPost table, so `post_detail` only needs one indexed lookup.
+"""
+import re
+import time
+from collections import Counter
+import numpy as np
+import scipy.sparse as sp
+from civic_app import app, db
+from civic_app.models import Post, RelatedPost
+
+
+TOP_K = 5
+BATCH_SIZE = 256
+# Rebuild from scratch once new posts make up this share of the corpus.
+# Incremental runs recompute IDF over all posts but only search new posts
+# against the stored lists, so an old post never picks up another old post
+# whose similarity rose as the IDF weights drifted.
+FULL_REBUILD_RATIO = 0.2
+# Every indexed post gets a row at this rank pointing at itself, so posts
+# with no similar post are not mistaken for new ones on the next run.
+INDEXED_RANK = -1
+
+TOKEN_RE = re.compile(r"[a-z0-9]{2,}")
+TAG_RE = re.compile(r"<[^>]+>")
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(TAG_RE.sub(' ', text or '').lower())
+
+
+def build_tfidf(docs):
+    """Return an L2-normalised CSR TF-IDF matrix, one row per document."""
+    vocab = {}
+    indptr = [0]
+    indices = []
+    counts = []
+    for doc in docs:
+        for term, count in Counter(tokenize(doc)).items():
+            indices.append(vocab.setdefault(term, len(vocab)))
+            counts.append(count)
+        indptr.append(len(indices))
+    n_docs = len(indptr) - 1
+
+    tf = sp.csr_matrix(
+        (np.asarray(counts, dtype=np.float32), np.asarray(indices, dtype=np.int32), np.asarray(indptr, dtype=np.int64)),
+        shape=(n_docs, len(vocab)),
+    )
+    # Smoothed IDF, same formula as scikit-learn's default
+    df = np.bincount(tf.indices, minlength=len(vocab))
+    idf = np.log((1 + n_docs) / (1 + df)).astype(np.float32) + 1
+    tfidf = tf @ sp.diags(idf)
+
+    norms = np.sqrt(np.asarray(tfidf.multiply(tfidf).sum(axis=1)).ravel())
+    norms[norms == 0] = 1
+    return sp.csr_matrix(sp.diags(1 / norms) @ tfidf, dtype=np.float32)
+
+
+def top_k_neighbours(queries, corpus, query_offset=0, k=TOP_K, batch_size=BATCH_SIZE):
+    """Yield (row, neighbour_cols, scores) for each query row, best first.
+
+    Similarities are computed one batch of rows at a time so memory stays at
+    batch_size x len(corpus). `query_offset` is the position of the first
+    query row inside `corpus`, used to drop self-matches; pass None when the
+    queries are not part of the corpus.
+    """
+    corpus_t = corpus.T.tocsc()
+    n = corpus.shape[0]
+    k = min(k, n)
+    if k <= 0:
+        for i in range(queries.shape[0]):
+            yield i, np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        return
+
+    for start in range(0, queries.shape[0], batch_size):
+        sims = (queries[start:start + batch_size] @ corpus_t).toarray()
+        if query_offset is not None:
+            rows = np.arange(sims.shape[0])
+            sims[rows, rows + start + query_offset] = 0
+
+        top = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(sims, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+
+        for i in range(sims.shape[0]):
+            keep = top_scores[i] > 0
+            yield start + i, top[i][keep], top_scores[i][keep]
+
+
+def _rows_for(post_id, neighbours):
+    return [{'post_id': post_id, 'rank': INDEXED_RANK, 'related_post_id': post_id, 'score': 0}] + [
+        {'post_id': post_id, 'rank': rank, 'related_post_id': related_id, 'score': score}
+        for rank, (related_id, score) in enumerate(neighbours)
+    ]
+
+
+def _replace_rows(post_ids, rows):
+    for start in range(0, len(post_ids), 500):
+        RelatedPost.query.filter(RelatedPost.post_id.in_(post_ids[start:start + 500])).delete(synchronize_session=False)
+    if rows:
+        db.session.bulk_insert_mappings(RelatedPost, rows)
+
+
+def _rescored_lists(matrix, ids):
+    """Stored neighbour lists keyed by post id, rescored against `matrix`.
+
+    Stored scores come from an older IDF, so they are recomputed before being
+    compared with fresh ones. Neighbours that no longer exist are dropped.
+    """
+    pos = {post_id: i for i, post_id in enumerate(ids.tolist())}
+    pairs = [
+        (post_id, related_id)
+        for post_id, related_id in db.session.query(
+            RelatedPost.post_id, RelatedPost.related_post_id
+        ).filter(RelatedPost.rank != INDEXED_RANK)
+        if post_id in pos and related_id in pos
+    ]
+    if not pairs:
+        return {}
+    rows = np.array([pos[a] for a, _ in pairs])
+    cols = np.array([pos[b] for _, b in pairs])
+    scores = np.asarray(matrix[rows].multiply(matrix[cols]).sum(axis=1)).ravel()
+
+    current = {}
+    for (post_id, related_id), score in zip(pairs, scores.tolist()):
+        current.setdefault(post_id, []).append((related_id, score))
+    return current
+
+
+def rebuild_related_index(k=TOP_K):
+    posts = db.session.query(Post.id, Post.title, Post.rss_description).order_by(Post.id).all()
+    ids = np.array([p.id for p in posts], dtype=np.int64)
+    matrix = build_tfidf(f'{p.title} {p.rss_description or ""}' for p in posts)
+
+    RelatedPost.query.delete()
+    rows = []
+    for i, cols, scores in top_k_neighbours(matrix, matrix, k=k):
+        rows.extend(_rows_for(int(ids[i]), zip(ids[cols].tolist(), scores.tolist())))
+    if rows:
+        db.session.bulk_insert_mappings(RelatedPost, rows)
+    db.session.commit()
+    return len(posts)
+
+
+def refresh_related_index(post_ids, k=TOP_K):
+    """Recompute the neighbour lists of `post_ids`, e.g. after posts they listed were archived."""
+    post_ids = set(post_ids)
+    posts = db.session.query(Post.id, Post.title, Post.rss_description).order_by(Post.id).all()
+    ids = np.array([p.id for p in posts], dtype=np.int64)
+    pos = np.array([i for i, p in enumerate(posts) if p.id in post_ids], dtype=np.int64)
+    if not len(pos):
+        return 0
+    matrix = build_tfidf(f'{p.title} {p.rss_description or ""}' for p in posts)
+
+    rows = []
+    for i, cols, scores in top_k_neighbours(matrix[pos], matrix, query_offset=None, k=k + 1):
+        # Queries are scattered through the corpus, so drop the self-match here
+        neighbours = [(r, s) for r, s in zip(ids[cols].tolist(), scores.tolist()) if r != ids[pos[i]]]
+        rows.extend(_rows_for(int(ids[pos[i]]), neighbours[:k]))
+    _replace_rows(ids[pos].tolist(), rows)
+    db.session.commit()
+    return len(pos)
+
+
+def update_related_index(k=TOP_K):
+    """Index posts not seen by an earlier run and let them into older lists.
+
+    Falls back to a full rebuild when the new posts are a large share of the
+    corpus.
+    """
+    posts = db.session.query(Post.id, Post.title, Post.rss_description).order_by(Post.id).all()
+    indexed = {pid for (pid,) in db.session.query(RelatedPost.post_id).distinct()}
+    new_pos = [i for i, p in enumerate(posts) if p.id not in indexed]
+    if not new_pos:
+        return 0
+    if len(new_pos) > FULL_REBUILD_RATIO * len(posts):
+        return rebuild_related_index(k)
+
+    # Put new posts last so self-matches line up with query_offset
+    old_pos = [i for i, p in enumerate(posts) if p.id in indexed]
+    posts = [posts[i] for i in old_pos + new_pos]
+    ids = np.array([p.id for p in posts], dtype=np.int64)
+    matrix = build_tfidf(f'{p.title} {p.rss_description or ""}' for p in posts)
+    n_old = len(old_pos)
+
+    current = _rescored_lists(matrix, ids)
+
+    new_ids = ids[n_old:].tolist()
+    rows = []
+    for i, cols, scores in top_k_neighbours(matrix[n_old:], matrix, query_offset=n_old, k=k):
+        rows.extend(_rows_for(new_ids[i], zip(ids[cols].tolist(), scores.tolist())))
+    _replace_rows(new_ids, rows)
+
+    # Old posts only need to change where a new post beats their current list
+    changed_ids = []
+    changed_rows = []
+    for i, cols, scores in top_k_neighbours(matrix[:n_old], matrix[n_old:], query_offset=None, k=k):
+        if not len(cols):
+            continue
+        post_id = int(ids[i])
+        neighbours = current.get(post_id, [])
+        floor = min(s for _, s in neighbours) if len(neighbours) >= k else 0
+        candidates = [(new_ids[c], s) for c, s in zip(cols.tolist(), scores.tolist()) if s > floor]
+        if not candidates:
+            continue
+        merged = dict(neighbours)
+        merged.update(candidates)
+        merged = sorted(merged.items(), key=lambda n: -n[1])[:k]
+        changed_ids.append(post_id)
+        changed_rows.extend(_rows_for(post_id, merged))
+    _replace_rows(changed_ids, changed_rows)
+
+    db.session.commit()
+    return len(new_ids)
+
+
+def run_related_index():
+    with app.app_context():
+        start = time.perf_counter()
+        indexed = update_related_index()
+        print(f'Related posts: indexed {indexed} posts in {time.perf_counter() - start:.2f}s')
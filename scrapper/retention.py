@@ -0,0 +1,230 @@
+"""Archive old posts and purge read notifications so site.db stops growing.
+
+Archived posts (with their comments and read notifications) are moved into `instance/archive.db`,
+which is ATTACHed as the `archive` schema and can still be queried with
+`query_archive`. Archive rows keep every column of the source row plus their
+own `archive_id`, since SQLite may hand a deleted post's id to a new post;
+`archive_post_id` on child rows points at the matching `archive.post` row.
+Each run ends with an incremental VACUUM and ANALYZE and prints how much
+space was reclaimed and how the usual scans sped up.
+"""
+import os
+import time
+from datetime import datetime, timedelta
+from statistics import median
+from sqlalchemy import text
+from civic_app import app, db
+from scrapper.data_loader import feed_titles
+from scrapper.related_posts import refresh_related_index
+
+
+ARCHIVE_DB = os.path.join(app.instance_path, 'archive.db')
+
+# Months after rss_pubDate before a post nobody is interested in is archived,
+# keyed by rss_category_id. The None key is the default for every other
+# category; a None value keeps that category's posts forever. Posts without
+# an rss_pubDate (parse_pubdate could not read the feed's date) are never
+# archived, as the post table has no other date to age them by.
+POST_ARCHIVE_MONTHS = {None: 12}
+# Days after scheduled_time before a read notification is deleted
+READ_NOTIFICATION_PURGE_DAYS = 30
+
+# Same scans the dashboard and the notification bar run on every page view
+BENCHMARK_QUERIES = {
+    'categories': (
+        'SELECT rss_category_id, rss_category_name, COUNT(id) FROM post '
+        'WHERE rss_category_id IS NOT NULL GROUP BY rss_category_id, rss_category_name'
+    ),
+    'trending': (
+        'SELECT post.id, COUNT(interest.id) AS interest_count FROM post '
+        'LEFT OUTER JOIN interest ON interest.post_id = post.id '
+        'GROUP BY post.id ORDER BY interest_count DESC LIMIT 5'
+    ),
+    'notifications': (
+        'SELECT id FROM notification WHERE is_read = 0 AND scheduled_time <= :now '
+        'ORDER BY scheduled_time DESC'
+    ),
+}
+
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+# Tables moved to the archive with their post, and the columns the archive
+# adds on top of the copied source columns
+ARCHIVE_COLUMNS = {
+    'post': ['archived_at DATETIME'],
+    'review': ['archive_post_id INTEGER', 'archived_at DATETIME'],
+    'notification': ['archive_post_id INTEGER', 'archived_at DATETIME'],
+}
+
+
+def _columns(conn, schema, table):
+    """{name: declared type} of the table as it is on disk, not as the model declares it."""
+    return {row[1]: row[2] for row in conn.execute(text(f'PRAGMA {schema}.table_info("{table}")'))}
+
+
+def _attach(conn):
+    conn.execute(text('ATTACH DATABASE :path AS archive'), {'path': ARCHIVE_DB})
+    for table, extra in ARCHIVE_COLUMNS.items():
+        source = _columns(conn, 'main', table)
+        cols = ', '.join([f'"{name}" {decl}' for name, decl in source.items()] + extra)
+        conn.execute(text(
+            f'CREATE TABLE IF NOT EXISTS archive.{table} (archive_id INTEGER PRIMARY KEY AUTOINCREMENT, {cols})'
+        ))
+        # Pick up columns added to the main table since the archive was created
+        archived = _columns(conn, 'archive', table)
+        for name, decl in source.items():
+            if name not in archived:
+                conn.execute(text(f'ALTER TABLE archive.{table} ADD COLUMN "{name}" {decl}'))
+        index_col = 'id' if table == 'post' else 'archive_post_id'
+        conn.execute(text(f'CREATE INDEX IF NOT EXISTS archive.ix_{table}_{index_col} ON {table} ({index_col})'))
+    conn.execute(text('CREATE INDEX IF NOT EXISTS archive.ix_post_category ON post (rss_category_id)'))
+
+
+def query_archive(sql, **params):
+    """Run `sql` with the archive attached, e.g. to join archive.post with main.user."""
+    with app.app_context(), db.engine.connect() as conn:
+        _attach(conn)
+        try:
+            return conn.execute(text(sql), params).all()
+        finally:
+            conn.execute(text('DETACH DATABASE archive'))
+
+
+def _select_posts_to_archive(conn, now, post_months):
+    conn.execute(text('CREATE TEMP TABLE IF NOT EXISTS archive_ids (id INTEGER PRIMARY KEY, archive_id INTEGER)'))
+    conn.execute(text('CREATE TEMP TABLE IF NOT EXISTS feed_title (title TEXT PRIMARY KEY)'))
+    conn.execute(text('DELETE FROM temp.archive_ids'))
+    conn.execute(text('DELETE FROM temp.feed_title'))
+    titles = feed_titles()
+    if titles:
+        conn.execute(text('INSERT INTO temp.feed_title (title) VALUES (:title)'), [{'title': t} for t in titles])
+
+    explicit = [cat for cat in post_months if cat is not None]
+    for cat, months in post_months.items():
+        if months is None:
+            continue
+        if cat is None:
+            in_category = '1 = 1'
+            if explicit:
+                in_category = (
+                    f'rss_category_id IS NULL OR rss_category_id NOT IN ({", ".join(str(int(c)) for c in explicit)})'
+                )
+        else:
+            in_category = f'rss_category_id = {int(cat)}'
+        # Posts still in the feeds are kept, otherwise the next import would re-add them
+        conn.execute(text(f'''
+            INSERT OR IGNORE INTO temp.archive_ids (id)
+            SELECT id FROM main.post
+            WHERE ({in_category})
+              AND "rss_pubDate" < :cutoff
+              AND id NOT IN (SELECT post_id FROM main.interest)
+              AND id NOT IN (SELECT post_id FROM main.notification WHERE is_read IS NOT 1)
+              AND title NOT IN (SELECT title FROM temp.feed_title)
+        '''), {'cutoff': (now - timedelta(days=30 * months)).strftime(DATE_FORMAT)})
+
+
+def _archive_children(conn, table, archived_at):
+    """Move the rows of `table` that belong to archived posts; return how many."""
+    cols = [f'"{c}"' for c in _columns(conn, 'main', table)]
+    moved = conn.execute(text(
+        f'INSERT INTO archive.{table} ({", ".join(cols)}, archive_post_id, archived_at) '
+        f'SELECT {", ".join("c." + c for c in cols)}, a.archive_id, :archived_at '
+        f'FROM main.{table} c JOIN temp.archive_ids a ON a.id = c.post_id'
+    ), archived_at).rowcount
+    conn.execute(text(f'DELETE FROM main.{table} WHERE post_id IN (SELECT id FROM temp.archive_ids)'))
+    return moved
+
+
+def archive_and_purge(conn, now, post_months=POST_ARCHIVE_MONTHS, notification_days=READ_NOTIFICATION_PURGE_DAYS):
+    """Move old posts, their comments and notifications to the archive, then
+    delete read notifications past READ_NOTIFICATION_PURGE_DAYS.
+
+    Returns the row counts and the ids of remaining posts whose related list
+    lost an archived post and needs recomputing.
+    """
+    _select_posts_to_archive(conn, now, post_months)
+    ids = 'SELECT id FROM temp.archive_ids'
+    archived_at = {'archived_at': now.strftime(DATE_FORMAT)}
+    counts = {}
+
+    cols = ', '.join(f'"{c}"' for c in _columns(conn, 'main', 'post'))
+    counts['archived_posts'] = conn.execute(text(
+        f'INSERT INTO archive.post ({cols}, archived_at) '
+        f'SELECT {cols}, :archived_at FROM main.post WHERE id IN ({ids})'
+    ), archived_at).rowcount
+    # The newest archive row for each source id is the one just inserted
+    conn.execute(text(
+        'UPDATE temp.archive_ids SET archive_id = ('
+        'SELECT MAX(archive_id) FROM archive.post WHERE archive.post.id = temp.archive_ids.id)'
+    ))
+    for table in ARCHIVE_COLUMNS:
+        if table != 'post':
+            counts[f'archived_{table}s'] = _archive_children(conn, table, archived_at)
+
+    stale_related = [pid for (pid,) in conn.execute(text(
+        f'SELECT DISTINCT post_id FROM main.related_post '
+        f'WHERE related_post_id IN ({ids}) AND post_id NOT IN ({ids})'
+    ))]
+    conn.execute(text(
+        f'DELETE FROM main.related_post WHERE post_id IN ({ids}) OR related_post_id IN ({ids})'
+    ))
+    counts['purged_notifications'] = conn.execute(text(
+        'DELETE FROM main.notification WHERE is_read IS 1 AND scheduled_time < :cutoff'
+    ), {'cutoff': (now - timedelta(days=notification_days)).strftime(DATE_FORMAT)}).rowcount
+    conn.execute(text(f'DELETE FROM main.post WHERE id IN ({ids})'))
+    conn.commit()
+    return counts, stale_related
+
+
+def compact(conn):
+    """Return freed pages to the filesystem and refresh the planner statistics."""
+    if conn.execute(text('PRAGMA main.auto_vacuum')).scalar() != 2:
+        # Switching to incremental mode only takes effect after one full VACUUM
+        conn.execute(text('PRAGMA main.auto_vacuum = INCREMENTAL'))
+        conn.execute(text('VACUUM main'))
+    else:
+        # Frees one page per step; executescript steps it to completion where
+        # a plain execute stops after the first page
+        conn.connection.dbapi_connection.executescript('PRAGMA main.incremental_vacuum;')
+    conn.execute(text('ANALYZE main'))
+
+
+def _db_stats(conn, now, repeat=5):
+    stats = {
+        'size': conn.execute(text('PRAGMA main.page_count')).scalar() * conn.execute(text('PRAGMA main.page_size')).scalar(),
+        'free_pages': conn.execute(text('PRAGMA main.freelist_count')).scalar(),
+        'timings': {},
+    }
+    params = {'now': now.strftime(DATE_FORMAT)}
+    for name, sql in BENCHMARK_QUERIES.items():
+        runs = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            conn.execute(text(sql), params if ':now' in sql else {}).all()
+            runs.append(time.perf_counter() - start)
+        stats['timings'][name] = median(runs)
+    return stats
+
+
+def run_retention(post_months=POST_ARCHIVE_MONTHS, notification_days=READ_NOTIFICATION_PURGE_DAYS):
+    now = datetime.utcnow()
+    with app.app_context(), db.engine.connect() as conn:
+        before = _db_stats(conn, now)
+        _attach(conn)
+        counts, stale_related = archive_and_purge(conn, now, post_months, notification_days)
+        conn.execute(text('DETACH DATABASE archive'))
+        conn.commit()
+        refresh_related_index(stale_related)
+
+        # VACUUM cannot run inside a transaction
+        conn = conn.execution_options(isolation_level='AUTOCOMMIT')
+        compact(conn)
+        after = _db_stats(conn, now)
+
+    print(f'Retention: archived {counts["archived_posts"]} posts with {counts["archived_reviews"]} comments '
+          f'and {counts["archived_notifications"]} notifications, purged {counts["purged_notifications"]} read notifications')
+    print(f'  -> site.db {before["size"] / 1024:.0f} KiB -> {after["size"] / 1024:.0f} KiB '
+          f'(reclaimed {(before["size"] - after["size"]) / 1024:.0f} KiB, free pages {before["free_pages"]} -> {after["free_pages"]})')
+    for name, took in before['timings'].items():
+        print(f'  -> {name}: {took * 1000:.2f} ms -> {after["timings"][name] * 1000:.2f} ms')
+    return {'counts': counts, 'before': before, 'after': after}